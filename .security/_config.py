@@ -0,0 +1,18 @@
+"""Scan configuration, loaded once from .security/config.yaml and shared by all modules."""
+
+import os
+import yaml
+
+# Prefer the libyaml C loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+CONFIG_PATH = ".security/config.yaml"
+
+if os.path.exists(CONFIG_PATH):
+    with open(CONFIG_PATH, "rb") as config_file:  # libyaml reads bytes directly
+        CONFIG = yaml.load(config_file, Loader=_YamlLoader)
+else:
+    raise FileNotFoundError("Missing .security/config.yaml file in project directory.")
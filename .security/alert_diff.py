@@ -1,62 +1,76 @@
 #!/usr/bin/env python3
 
 
-import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from urllib.parse import urlparse
 from pathlib import Path
 
+import ijson
+
+import json_utils
+
+# ijson prefixes of alert objects in the supported ZAP export shapes: a bare list of alerts,
+# or {"site": [{"alerts": [...]}]}, tried in order (older exports use "alert")
+LIST_ALERT_PREFIX = "item"
+SITE_ALERT_PREFIXES = ("site.item.alerts.item", "site.item.alert.item")
+
+# Diff artifacts are written here so callers can use the in-memory results right away;
+# a single worker keeps writes to the same file in submission order
+_artifact_writer = ThreadPoolExecutor(max_workers=1)
+# (filename, future) of writes not yet reported by wait_for_artifacts
+_pending_writes = []
+
 
 # ------------------------------------------------------------
 # Helper Functions
 # ------------------------------------------------------------
 
-def read_json(path: Path):
-    """Read and parse JSON safely."""
-    if not path.exists():
-        print(f"[WARN] File does not exist: {path}")
-        return []
-    
-    if path.stat().st_size == 0:
-        print(f"[WARN] File is empty: {path}")
-        return []
-    
+def _first_byte(f) -> bytes:
+    """Return the first non-whitespace byte of a binary file (b"" if there is none) and rewind it."""
+    first = b""
+    while True:
+        chunk = f.read(65536)
+        if not chunk:
+            break
+        stripped = chunk.lstrip()
+        if stripped:
+            first = stripped[:1]
+            break
+    f.seek(0)
+    return first
+
+
+def iter_report_alerts(path: Path):
+    """Stream alert objects from a ZAP report without loading the whole document."""
     try:
-        with path.open("r", encoding="utf-8") as f:
-            content = f.read().strip()
-            if not content:
-                print(f"[WARN] File contains only whitespace: {path}")
-                return []
-            return json.loads(content)
-    except json.JSONDecodeError as e:
+        with path.open("rb") as f:
+            first = _first_byte(f)
+            if not first:
+                # Zero bytes or whitespace only; ijson would report that as incomplete JSON
+                print(f"[WARN] File is empty: {path}")
+                return
+            # Pick the prefixes from the document shape so ijson.items builds the objects in C
+            prefixes = SITE_ALERT_PREFIXES if first == b"{" else (LIST_ALERT_PREFIX,)
+            for prefix in prefixes:
+                found = False
+                for alert in ijson.items(f, prefix, use_float=True):
+                    if isinstance(alert, dict) and "alert" in alert:
+                        found = True
+                        yield alert
+                if found:
+                    return
+                f.seek(0)
+    except FileNotFoundError:
+        print(f"[WARN] File does not exist: {path}")
+    except ijson.JSONError as e:
         print(f"[ERROR] Invalid JSON in {path}: {e}")
-        return []
     except Exception as e:
         print(f"[ERROR] Error reading {path}: {e}")
-        return []
-
-
-def iter_alert_objects(data):
-    """Yield all alert objects regardless of ZAP export structure."""
-    if isinstance(data, list):
-        for a in data:
-            if isinstance(a, dict) and "alert" in a:
-                yield a
-        return
-    if isinstance(data, dict):
-        sites = data.get("site") or []
-        if isinstance(sites, list):
-            for site in sites:
-                alerts = site.get("alerts") or site.get("alert") or []
-                if isinstance(alerts, list):
-                    for a in alerts:
-                        if isinstance(a, dict) and "alert" in a:
-                            yield a
 
 
-def normalize_url(url: str) -> str:
-    """Normalize URL by removing host, query, and trailing slash."""
-    if not url:
-        return ""
+def _normalize_url_fallback(url) -> str:
+    """Normalize URL with urlparse, for inputs the fast path does not handle."""
     try:
         parsed = urlparse(url)
         path = parsed.path or "/"
@@ -64,93 +78,179 @@ def normalize_url(url: str) -> str:
             path = path[:-1]
         return path.lower()
     except Exception:
-        return url.strip().lower().rstrip("/")
+        return str(url).strip().lower().rstrip("/")
+
+
+@lru_cache(maxsize=4096)
+def normalize_url(url: str) -> str:
+    """Normalize URL by removing host, query, and trailing slash.
+
+    Cached because ZAP reports repeat the same URL across many alerts.
+    """
+    if not url:
+        return ""
+    if not isinstance(url, str) or "\t" in url or "\n" in url or "\r" in url:
+        return _normalize_url_fallback(url)
 
+    # Fast path for the common shapes (absolute http(s) URLs and bare paths):
+    # only the path is kept, so slice it out instead of building a ParseResult
+    if url.startswith("/") and not url.startswith("//"):
+        authority_start = None
+    elif url[:7].lower() == "http://":
+        authority_start = 7
+    elif url[:8].lower() == "https://":
+        authority_start = 8
+    else:
+        return _normalize_url_fallback(url)
 
-def safe_str(v):
-    return str(v or "").strip()
+    end = len(url)
+    for marker in ("?", "#"):
+        pos = url.find(marker, 0, end)
+        if pos != -1:
+            end = pos
+
+    if authority_start is None:
+        start = 0
+    else:
+        start = url.find("/", authority_start, end)
+        if start == -1:
+            return "/"
+
+    path = url[start:end]
+    if ";" in path:
+        # urlparse treats ";..." in the last segment as params, not path
+        params = path.find(";", path.rfind("/"))
+        if params != -1:
+            path = path[:params]
+    path = path.lower()
+    if len(path) > 1 and path.endswith("/"):
+        path = path[:-1]
+    return path or "/"
+
+
+def _s(v) -> str:
+    """Stripped string form of a field; ZAP fields are usually str already."""
+    if not v:
+        return ""
+    if not isinstance(v, str):
+        v = str(v)
+    return v.strip()
+
+
+def _sl(v) -> str:
+    """Like _s, but lowercased, skipping .lower() when already lowercase."""
+    s = _s(v)
+    return s if s.islower() else s.lower()
 
 
 def alert_signature(a):
     """Create a normalized tuple key for comparison."""
+    # Bind the lookup once; this runs for every alert in both reports
+    get = a.get
     return (
-        safe_str(a.get("pluginId")),
-        safe_str(a.get("alert")).lower(),
-        safe_str(a.get("risk")).lower(),
-        safe_str(a.get("cweid")),
-        normalize_url(a.get("url", "")),
-        safe_str(a.get("param")),
+        _s(get("pluginId")),
+        _sl(get("alert")),
+        _sl(get("risk")),
+        _s(get("cweid")),
+        normalize_url(get("url", "")),
+        _s(get("param")),
     )
 
 
-def normalize_alerts(path: Path):
-    """Return (set of signatures, map of signature→alert) for a given ZAP file."""
-    data = read_json(path)
-    if not data:
-        print(f"[INFO] No alerts found in {path}, returning empty set and map")
-        return set(), {}
-    
-    alerts = list(iter_alert_objects(data))
-    norm_set = set()
-    norm_map = {}
-    for a in alerts:
-        sig = alert_signature(a)
-        norm_set.add(sig)
-        norm_map[sig] = a
-    return norm_set, norm_map
+def wait_for_artifacts():
+    """Wait for the background .jsonl writes and report each outcome from the calling thread."""
+    while _pending_writes:
+        filename, future = _pending_writes.pop(0)
+        error = future.exception()
+        if error is None:
+            print(f"[OK] Wrote {filename}")
+        else:
+            print(f"[ERROR] Could not write {filename}: {error}")
 
-def alert_diff (main_report_filename: str = "security_report_main.json", pr_report_filename: str = "security_report_pr.json"):
+def alert_diff (main_report_filename: str = "security_report_main.json", pr_report_filename: str = "security_report_pr.json", pr_alerts=None):
     """
-    ZAP JSON Diff (Main vs PR) - JSON Output Only
+    ZAP JSON Diff (Main vs PR) - JSON Lines Output Only
 
     Compares two ZAP reports (main vs PR) and outputs:
-        - new_alerts.json
-        - resolved_alerts.json
-        - common_alerts.json
+        - new_alerts.jsonl
+        - resolved_alerts.jsonl
+        - common_alerts.jsonl
 
     Normalization:
     - Ignores differences in hostname, querystring, trailing slashes
     - Drops noisy fields like confidence, evidence, IDs
     - Compares by (pluginId, alert, risk, cweid, normalized path, param)
 
+    Both reports are streamed: only the main report's signatures are kept while
+    the PR report is partitioned, and resolved alerts are picked up by a second
+    pass over the main report. Duplicate signatures keep their first alert.
+
+    If pr_alerts is given (e.g. straight from zap.core.alerts()), it is used instead
+    of re-reading pr_report_filename. Returns (new_alerts, resolved_alerts, common_alerts);
+    the .jsonl files are written in the background as side artifacts; call wait_for_artifacts()
+    to wait for them and report the outcome.
+
     Usage:
         python zap_diff_json.py --main security_report_main.json --pr security_report_pr.json
     """
+    main_path = Path(main_report_filename)
+
     print(f"[INFO] Loading main report: {main_report_filename}")
-    main_set, main_map = normalize_alerts(Path(main_report_filename))
+    main_signatures = {alert_signature(a) for a in iter_report_alerts(main_path)}
+    if not main_signatures:
+        print(f"[INFO] No alerts found in {main_path}")
 
-    print(f"[INFO] Loading PR report: {pr_report_filename}")
-    pr_set, pr_map = normalize_alerts(Path(pr_report_filename))
+    if pr_alerts is None:
+        print(f"[INFO] Loading PR report: {pr_report_filename}")
+        pr_alerts = iter_report_alerts(Path(pr_report_filename))
+    else:
+        pr_alerts = (a for a in pr_alerts if isinstance(a, dict) and "alert" in a)
 
-    new_signatures = pr_set - main_set
-    resolved_signatures = main_set - pr_set
-    common_signatures = pr_set & main_set
+    pr_signatures = set()
+    new_alerts = []
+    common_alerts = []
+    for a in pr_alerts:
+        sig = alert_signature(a)
+        if sig in pr_signatures:
+            continue
+        pr_signatures.add(sig)
+        if sig in main_signatures:
+            common_alerts.append(a)
+        else:
+            new_alerts.append(a)
+    if not pr_signatures:
+        print("[INFO] No alerts found in the PR report")
 
-    new_alerts = [pr_map[s] for s in new_signatures if s in pr_map]
-    resolved_alerts = [main_map[s] for s in resolved_signatures if s in main_map]
-    common_alerts = [pr_map[s] for s in common_signatures if s in pr_map]
+    resolved_signatures = main_signatures - pr_signatures
+    resolved_alerts = []
+    if resolved_signatures:
+        for a in iter_report_alerts(main_path):
+            sig = alert_signature(a)
+            if sig in resolved_signatures:
+                resolved_signatures.discard(sig)
+                resolved_alerts.append(a)
 
     print("\n=== ZAP DIFF SUMMARY ===")
     print(f"🆕 New alerts: {len(new_alerts)}")
     print(f"✅ Resolved alerts: {len(resolved_alerts)}")
     print(f"⚙️ Common alerts: {len(common_alerts)}")
 
-    # Write results
-    with open("new_alerts.json", "w", encoding="utf-8") as f:
-        json.dump(new_alerts, f, indent=2)
-
-    with open("resolved_alerts.json", "w", encoding="utf-8") as f:
-        json.dump(resolved_alerts, f, indent=2)
-
-    with open("common_alerts.json", "w", encoding="utf-8") as f:
-        json.dump(common_alerts, f, indent=2)
-
-    print("\n[OK] Wrote new_alerts.json")
-    print("[OK] Wrote resolved_alerts.json")
-    print("[OK] Wrote common_alerts.json")
+    # Write results in the background, off the caller's critical path.
+    # Serialize here so later changes to the alert objects (e.g. added summaries) don't leak into the files.
+    outputs = {
+        "new_alerts.jsonl": new_alerts,
+        "resolved_alerts.jsonl": resolved_alerts,
+        "common_alerts.jsonl": common_alerts,
+    }
+    for filename, alerts in outputs.items():
+        _pending_writes.append((filename, _artifact_writer.submit(Path(filename).write_bytes, json_utils.dumps_jsonl(alerts))))
 
     # Optional quick summary of top new alerts
     if new_alerts:
         print("\nTop NEW alerts (up to 10):")
         for i, alert in enumerate(new_alerts[:10]):
             print(f"- [{alert.get('risk')}] {alert.get('alert')} @ {normalize_url(alert.get('url',''))}")
+
+    normalize_url.cache_clear()
+
+    return new_alerts, resolved_alerts, common_alerts
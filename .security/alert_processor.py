@@ -1,85 +1,254 @@
 import openai
 import os
-import json
-import yaml
+import hashlib
 import sys
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+
+import tiktoken
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+import json_utils
+from _config import CONFIG
+from alert_diff import alert_signature
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
+# Initialize OpenAI client; retries are handled by _chat, so the SDK's own retries are disabled
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
-
-# Load filtering preferences from YAML config
-CONFIG_PATH = ".security/config.yaml"
-if os.path.exists(CONFIG_PATH):
-    with open(CONFIG_PATH, "r") as config_file:
-        config = yaml.safe_load(config_file)
-else:
-    raise FileNotFoundError("Missing .security/config.yaml file in project directory.")
+client = openai.OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
 
 # Get the max number of alerts to include in the report
-alerts_limit = config.get("alerts_limit", 5)
+alerts_limit = CONFIG.get("alerts_limit", 5)
+
+# LLM model used for alert and final summaries
+model = CONFIG.get("model", "gpt-4o-mini")
+
+# Get the max number of alert summaries requested from the LLM at the same time
+summary_workers = CONFIG.get("summary_workers", 4)
+
+# Approximate token budget for the alerts packed into one bulk summary request
+bulk_summary_max_tokens = CONFIG.get("bulk_summary_max_tokens", 6000)
+
+# Max number of tokens of PR code changes sent along with new alerts
+pr_changes_max_tokens = CONFIG.get("pr_changes_max_tokens", 4000)
+
+BULK_SUMMARY_INSTRUCTIONS = (
+    "\n\nYou will receive several security alerts, each prefixed with a numeric id such as [1]. "
+    "Summarize each alert separately and respond only with a JSON object that maps each id, as a string, "
+    'to its summary, for example {"1": "...", "2": "..."}.'
+)
+
+# Summaries of previously seen alerts, keyed by prompt and alert signature
+SUMMARY_CACHE_PATH = ".security/.summary_cache.json"
+_cache_lock = threading.Lock()
+# Cache keys used by this process; anything else in the cache file is stale (old prompt, model or alert)
+_cache_live_keys = set()
 
 def normalize_levels(config: dict, key: str) -> set:
     """Safely load and normalize risk levels from config into a lowercase set."""
     return set(level.lower() for level in (config.get(key) or []))
 
+# Desired order of risk levels when sorting alerts
+_RISK_ORDER = {"high": 0, "medium": 1, "low": 2, "informational": 3}
+
 # Normalize risk levels from config
-summarize_levels = normalize_levels(config, "summarize_levels")
-ignore_levels = normalize_levels(config, "ignore_levels") # For ignoring the alert levels
-fail_on_levels = normalize_levels(config, "fail_on_levels") # For pipeline gating
+summarize_levels = normalize_levels(CONFIG, "summarize_levels")
+ignore_levels = normalize_levels(CONFIG, "ignore_levels") # For ignoring the alert levels
+fail_on_levels = normalize_levels(CONFIG, "fail_on_levels") # For pipeline gating
+
+@retry(
+    retry=retry_if_exception_type((openai.APIConnectionError, openai.ConflictError, openai.RateLimitError, openai.InternalServerError)),
+    wait=wait_exponential(min=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+def _chat(system_prompt: str, user_content: str, temperature: float = 0.5) -> str:
+    """Send one system+user chat request and return the reply text.
+    Transient API failures (connection errors and timeouts, 409 conflicts, rate limits, 5xx) are retried
+    with exponential backoff; this is the only retry layer."""
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ],
+        temperature=temperature
+    )
+    return response.choices[0].message.content
 
+@lru_cache(maxsize=16)
 def load_prompt(path: str, default: str) -> str:
-    """Load a prompt from a file or fallback to a default string."""
+    """Load a prompt from a file or fallback to a default string.
+    Cached since the same few prompt files are used for every alert."""
     if os.path.exists(path):
         with open(path, "r", encoding="utf-8") as f:
             return f.read().strip()
     return default
 
-def get_summary(alert, include_pr_changes: bool = False, prompt_path: str = ".security/prompts/prompt_alert.txt"):
+def _load_cache() -> dict:
+    """Load cached alert summaries, or an empty cache if none is available."""
+    try:
+        cache = json_utils.load_file(SUMMARY_CACHE_PATH)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️ Warning: Could not read summary cache {SUMMARY_CACHE_PATH}: {e}")
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    # Skip empty summaries an older cache may contain
+    return {key: summary for key, summary in cache.items() if isinstance(summary, str) and summary}
+
+def _save_cache(entries: dict):
+    """Write the summaries used by this scan (cache hits and new ones) to the on-disk cache for later scans.
+    Only entries used by this process are kept, so the file does not grow with summaries for old prompts,
+    models or alerts that no longer occur. Report categories may be summarized concurrently, so the
+    read-merge-write is done under a lock."""
+    with _cache_lock:
+        _cache_live_keys.update(entries)
+        cache = {key: summary for key, summary in _load_cache().items() if key in _cache_live_keys}
+        cache.update(entries)
+        try:
+            json_utils.dump_file(SUMMARY_CACHE_PATH, cache)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not write summary cache {SUMMARY_CACHE_PATH}: {e}")
+
+def _cache_key(alert, prompt: str) -> str:
+    """Key a summary by its alert signature, prompt and model, so changing either invalidates it."""
+    prompt_hash = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()[:16]
+    return "|".join((prompt_hash, *alert_signature(alert)))
+
+# Rough characters-per-token ratio, used when no tokenizer can be loaded
+APPROX_CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=None)
+def _token_encoding():
+    """Tokenizer of the configured model, loaded once, or None if it cannot be loaded
+    (tiktoken downloads its BPE files on first use, which fails without network access)."""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Model not known to this tiktoken version; use the encoding of current OpenAI models
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not load tokenizer, using approximate token counts: {e}")
+        return None
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text, approximated from its length when no tokenizer is available."""
+    encoding = _token_encoding()
+    if encoding is None:
+        return len(text) // APPROX_CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+def load_pr_changes() -> str:
+    """Load PR code changes if available (created by GitHub Actions workflow), or an empty string."""
+    pr_changes_path = "pr_changes.txt"
+    if not os.path.exists(pr_changes_path):
+        return ""
+    try:
+        with open(pr_changes_path, "r", encoding="utf-8") as f:
+            pr_changes = f.read().strip()
+    except Exception as e:
+        print(f"⚠️ Warning: Could not read PR changes from {pr_changes_path}: {e}")
+        return ""
+
+    # Limit PR changes size to avoid token limits (keep the first pr_changes_max_tokens tokens)
+    encoding = _token_encoding()
+    if encoding is None:
+        max_chars = pr_changes_max_tokens * APPROX_CHARS_PER_TOKEN
+        if len(pr_changes) > max_chars:
+            pr_changes = pr_changes[:max_chars] + "\n\n... (truncated for length)"
+        return pr_changes
+    tokens = encoding.encode(pr_changes, disallowed_special=())
+    if len(tokens) > pr_changes_max_tokens:
+        pr_changes = encoding.decode(tokens[:pr_changes_max_tokens]) + "\n\n... (truncated for length)"
+    return pr_changes
+
+def format_pr_changes(pr_changes: str, issue: str = "this security issue") -> str:
+    """Format PR code changes as extra context appended to a summary request."""
+    return (
+        "\n\n--- PR Code Changes (for context) ---\n"
+        + pr_changes
+        + "\n\n--- End of PR Code Changes ---"
+        + f"\n\nPlease provide suggestions for fixing {issue} considering the code changes shown above. If the vulnerability is related to the changed code, suggest specific fixes that account for the PR changes."
+    )
+
+def _alert_json(alert) -> str:
+    """Pretty-printed JSON of an alert, as sent to the model and shown in the detailed summaries."""
+    return json_utils.dumps(alert, indent=True).decode("utf-8")
+
+def get_summary(alert, pr_changes_text: str = None, prompt_path: str = ".security/prompts/prompt_alert.txt"):
     """Summarize an individual alert using ChatGPT and a user-defined prompt.
-    If pr_changes.txt exists, includes PR code changes for better context-aware suggestions."""
+    If pr_changes_text is given, includes PR code changes for better context-aware suggestions."""
     system_prompt = load_prompt(
         prompt_path,
         "You are a cybersecurity expert. Summarize the following security alert."
     )
 
     # Build user message with alert
-    user_content = json.dumps(alert, indent=2)
-    
-    # Load PR code changes if available (created by GitHub Actions workflow)
-    pr_changes_path = "pr_changes.txt"
-    if include_pr_changes and os.path.exists(pr_changes_path):
-        try:
-            with open(pr_changes_path, "r", encoding="utf-8") as f:
-                pr_changes = f.read().strip()
-            
-            if pr_changes:
-                # Limit PR changes size to avoid token limits (keep first 8000 chars)
-                if len(pr_changes) > 8000:
-                    pr_changes = pr_changes[:8000] + "\n\n... (truncated for length)"
-                
-                user_content += "\n\n--- PR Code Changes (for context) ---\n"
-                user_content += pr_changes
-                user_content += "\n\n--- End of PR Code Changes ---"
-                user_content += "\n\nPlease provide suggestions for fixing this security issue considering the code changes shown above. If the vulnerability is related to the changed code, suggest specific fixes that account for the PR changes."
-        except Exception as e:
-            print(f"⚠️ Warning: Could not read PR changes from {pr_changes_path}: {e}")
+    user_content = _alert_json(alert)
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_content}
-        ],
-        temperature=0.5
-    )
-    return response.choices[0].message.content
+    if pr_changes_text:
+        user_content += format_pr_changes(pr_changes_text)
+
+    return _chat(system_prompt, user_content)
+
+def get_summaries_bulk(alerts, pr_changes_text: str = None, prompt_path: str = ".security/prompts/prompt_alert.txt"):
+    """Summarize several alerts with a single ChatGPT request.
+    Returns summaries in the same order as alerts, with None for any alert the model did not answer."""
+    system_prompt = load_prompt(
+        prompt_path,
+        "You are a cybersecurity expert. Summarize the following security alert."
+    ) + BULK_SUMMARY_INSTRUCTIONS
+
+    # Number the alerts so the model can key its answers by id
+    user_content = "\n\n".join(f"[{i}] {_alert_json(alert)}" for i, alert in enumerate(alerts, 1))
+
+    if pr_changes_text:
+        user_content += format_pr_changes(pr_changes_text, issue="each security issue")
+
+    content = _chat(system_prompt, user_content) or ""
+
+    # Tolerate prose or code fences around the JSON object
+    try:
+        summaries = json_utils.loads(content[content.find("{"):content.rfind("}") + 1])
+    except ValueError:
+        print(f"⚠️ Warning: Could not parse bulk summary response for {len(alerts)} alert(s).")
+        return [None] * len(alerts)
+    if not isinstance(summaries, dict):
+        return [None] * len(alerts)
+
+    results = []
+    for i in range(1, len(alerts) + 1):
+        summary = summaries.get(str(i))
+        results.append(summary if isinstance(summary, str) and summary.strip() else None)
+    return results
+
+def chunk_alerts_by_tokens(alerts, max_tokens: int):
+    """Split alerts into chunks whose serialized size stays under max_tokens.
+    An alert that is larger than max_tokens on its own gets a chunk to itself."""
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    for alert in alerts:
+        tokens = count_tokens(_alert_json(alert))
+        if chunk and chunk_tokens + tokens > max_tokens:
+            chunks.append(chunk)
+            chunk = []
+            chunk_tokens = 0
+        chunk.append(alert)
+        chunk_tokens += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
 
 def generate_final_summary(
     alert_summaries, 
@@ -91,15 +260,19 @@ def generate_final_summary(
     """Generate final report from summarized alerts and append ChatGPT's high-level summary."""
     
     total_alerts = len(all_alerts)
-    risk_counts = Counter(alert.get("risk", "Unknown").capitalize() for alert in all_alerts)
-    summarized_levels = sorted(set(alert.get("risk", "Unknown").capitalize() for alert in summarized_alerts))
+    risk_counts = Counter()
+    for alert in all_alerts:
+        risk_counts[(alert.get("risk") or "Unknown").capitalize()] += 1
+    summarized_levels = set()
+    for alert in summarized_alerts:
+        summarized_levels.add((alert.get("risk") or "Unknown").capitalize())
 
     # Contextual summary
     stats_intro = (
         f"Security scan detected **{total_alerts}** total alerts.\n\n" +
         f"📊 **Risk Level Breakdown:**\n" +
         "".join(f"- {level}: {count}\n" for level, count in risk_counts.items()) + "\n" +
-        f"✅ **Alerts summarized in this report**: {', '.join(summarized_levels) or 'None'}.\n" +
+        f"✅ **Alerts summarized in this report**: {', '.join(sorted(summarized_levels)) or 'None'}.\n" +
         f"🔒 Total number of alerts in the report: {alerts_count}.\n\n"
     )
 
@@ -110,36 +283,21 @@ def generate_final_summary(
         "You are a security engineer. Analyze the provided summaries and generate a high-level report with urgent issues and recommendations."
     )
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": summaries_text}
-        ],
-        temperature=0.5
-    )
+    return stats_intro + _chat(system_prompt, summaries_text)
 
-    return stats_intro + response.choices[0].message.content
+def _risk_key(alert):
+    """Sort key for an alert's risk; unexpected or missing risks sort last."""
+    return _RISK_ORDER.get(str(alert.get("risk", "")).lower(), 99)
 
 def sort_alerts_by_risk(alerts):
-    """Sort alerts by risk"""
-    # Define the desired order of risk levels for sorting
-    risk_order = {"high": 0, "medium": 1, "low": 2, "informational": 3}
-
-    # Sort alerts by risk before further processing or saving
-    def alert_risk_key(alert):
-        # Normalize risk string to lowercase and fall back to a large value if missing or unexpected risk
-        return risk_order.get(str(alert.get("risk", "")).lower(), 99)
-
-    sorted_alerts = sorted(alerts, key=alert_risk_key)
-
-    return sorted_alerts
+    """Sort alerts by risk in place and return the same list."""
+    alerts.sort(key=_risk_key)
+    return alerts
 
 def sort_and_save_alerts(alerts, filename: str):
     sorted_alerts = sort_alerts_by_risk(alerts)
 
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(sorted_alerts, f, indent=2)
+    json_utils.dump_file(filename, sorted_alerts)
     print(f"📄 JSON report saved as: {filename}")
     return sorted_alerts
 
@@ -147,6 +305,8 @@ def sort_and_save_alerts(alerts, filename: str):
 def create_alert_summaries(alerts, prompt_path: str = ".security/prompts/prompt_alert.txt", include_pr_changes: bool = False):
     """Create alert summaries and count the number of total processed alerts and pipeline-failing alerts."""
     alert_summaries = []
+    to_summarize = []  # (alert, cache key) pairs at summarize_levels without a cached summary
+    cache_hits = {}  # cache key -> summary for alerts answered from the cache
     fail_risk_alerts = 0  # Counter for pipeline-failing alerts
     total_processed_alerts = 0  # To respect alerts_limit
 
@@ -155,6 +315,11 @@ def create_alert_summaries(alerts, prompt_path: str = ".security/prompts/prompt_
     # Sort alerts by risk
     alerts = sort_alerts_by_risk(alerts)
 
+    # Summaries that include PR code changes are specific to this diff, so only cache the others
+    use_cache = not include_pr_changes
+    cache = _load_cache() if use_cache else {}
+    prompt = load_prompt(prompt_path, "")
+
     for alert in alerts:
         risk_level = alert.get("risk", "").lower()
 
@@ -175,19 +340,49 @@ def create_alert_summaries(alerts, prompt_path: str = ".security/prompts/prompt_
 
         # Summarize only if risk is in summarize_levels
         if risk_level in summarize_levels:
-            summary = get_summary(alert, prompt_path=prompt_path, include_pr_changes=include_pr_changes)
+            key = _cache_key(alert, prompt) if use_cache else None
+            if key in cache:
+                alert["summary"] = cache_hits[key] = cache[key]
+            else:
+                to_summarize.append((alert, key))
         else:
-            summary = "*No summary generated for this alert based on configuration.*"
+            alert["summary"] = "*No summary generated for this alert based on configuration.*"
 
-        # Add summary directly into the alert JSON object
-        alert["summary"] = summary
         alert_summaries.append(alert)
 
-    return alert_summaries, total_processed_alerts, fail_risk_alerts
+    # Pack alerts into as few requests as the token budget allows and send the chunks concurrently;
+    # alerts the model skipped in a bulk answer fall back to one request each
+    if to_summarize:
+        pending = [alert for alert, _ in to_summarize]
+        chunks = chunk_alerts_by_tokens(pending, bulk_summary_max_tokens)
+        print(f"🤖 Requesting {len(pending)} summaries in {len(chunks)} request(s) ({len(alert_summaries) - len(pending)} from cache or config).")
+        # Read PR code changes once for all requests rather than per alert
+        pr_changes_text = load_pr_changes() if include_pr_changes else None
+        summarize_bulk = partial(get_summaries_bulk, prompt_path=prompt_path, pr_changes_text=pr_changes_text)
+        summarize = partial(get_summary, prompt_path=prompt_path, pr_changes_text=pr_changes_text)
+        with ThreadPoolExecutor(max_workers=summary_workers) as executor:
+            summaries = [summary for chunk_summaries in executor.map(summarize_bulk, chunks) for summary in chunk_summaries]
+            missing = [i for i, summary in enumerate(summaries) if summary is None]
+            for i, summary in zip(missing, executor.map(summarize, [pending[i] for i in missing])):
+                summaries[i] = summary
+
+        new_entries = {}
+        for (alert, key), summary in zip(to_summarize, summaries):
+            # Add summary directly into the alert JSON object; empty answers are not cached
+            if summary:
+                alert["summary"] = summary
+                new_entries[key] = summary
+            else:
+                alert["summary"] = "*No summary available: the model returned an empty response.*"
+
+        if use_cache:
+            cache_hits.update(new_entries)
 
-def load_alerts(filename):
-    with open(filename, "r", encoding="utf-8") as f:
-        return json.load(f)
+    if use_cache and cache_hits:
+        # Rewrite hits as well as new summaries, so entries this scan did not use are pruned
+        _save_cache(cache_hits)
+
+    return alert_summaries, total_processed_alerts, fail_risk_alerts
 
 def get_alert_summaries_and_final_summary(
     alerts, 
@@ -211,7 +406,7 @@ def get_alert_summaries_and_final_summary(
     # Format individual summaries
     summaries_text = ""
     for i, alert in enumerate(alert_summaries, 1):
-        summaries_text += f"\nAlert {i}:\n{json.dumps(alert, indent=2)}\n"
+        summaries_text += f"\nAlert {i}:\n{_alert_json(alert)}\n"
         summaries_text += f"Summary:\n{alert.get('summary', '')}\n"
 
     # Generate final summary
@@ -224,25 +419,3 @@ def get_alert_summaries_and_final_summary(
     )
 
     return (summaries_text, final_summary, fail_risk_alerts, alert_summaries)
-    
-def count_alerts(filename):
-    """
-    Count the number of alerts in the provided JSON file.
-    If the file does not exist or is invalid, returns 0.
-    """
-    if not os.path.isfile(filename):
-        print(f"⚠️ File {filename} does not exist")
-        return 0
-    try:
-        with open(filename, "r", encoding="utf-8") as f:
-            alerts = json.load(f)
-            # If alerts is a dict, count its items; if a list, count its length
-            if isinstance(alerts, list):
-                return len(alerts)
-            elif isinstance(alerts, dict):
-                return len(alerts)
-            else:
-                return 0
-    except Exception as e:
-        print(f"⚠️ Error reading {filename}: {e}.")
-        return 0
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""JSON helpers backed by orjson, falling back to the stdlib json module when it is not installed."""
+
+import json
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """Parse JSON from a str or bytes object."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, indent: bool = False) -> bytes:
+    """Serialize obj to UTF-8 JSON bytes, pretty-printed with 2 spaces when indent is set."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def load_file(path):
+    """Read and parse a JSON file."""
+    return loads(Path(path).read_bytes())
+
+
+def dump_file(path, obj, indent: bool = True):
+    """Serialize obj and write it to path."""
+    Path(path).write_bytes(dumps(obj, indent=indent))
+
+
+def dumps_jsonl(objs) -> bytes:
+    """Serialize objs as JSON Lines bytes, one compact object per line."""
+    return b"".join(dumps(obj) + b"\n" for obj in objs)
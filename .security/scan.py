@@ -2,33 +2,29 @@
 import time
 import os
 import sys
-import yaml
-import json
 import re
 import html
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from types import SimpleNamespace
 from dotenv import load_dotenv
+import requests
+from requests.adapters import HTTPAdapter
 from zapv2 import ZAPv2
 
 # Add .security directory to Python path so imports work when run from project root
 script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, script_dir)
 
-from alert_processor import sort_and_save_alerts, count_alerts, get_alert_summaries_and_final_summary, load_alerts
+from alert_processor import sort_and_save_alerts, get_alert_summaries_and_final_summary
 from github import post_pr_comment
-from alert_diff import alert_diff
+from alert_diff import alert_diff, wait_for_artifacts
+from _config import CONFIG
+import json_utils
 # Load environment variables
 load_dotenv()
 
-# Load scan config
-CONFIG_PATH = ".security/config.yaml"
-if os.path.exists(CONFIG_PATH):
-    with open(CONFIG_PATH, "r") as config_file:
-        config = yaml.safe_load(config_file)
-else:
-    raise FileNotFoundError("Missing .security/config.yaml file in project directory.")
-
-scans_config = config.get("scans", {})
+scans_config = CONFIG.get("scans", {})
 run_spider = scans_config.get("spider", True)
 run_ajax_spider = scans_config.get("ajax_spider", False)
 ajax_spider_timeout = scans_config.get("ajax_spider_timeout", 120)  # default 120 seconds
@@ -43,164 +39,306 @@ if not (run_spider or run_ajax_spider or run_passive or run_active):
     raise ValueError("❌ No scans selected! Please enable at least one scan type in .security/config.yaml.")
 
 
+class KeepAliveZAPv2(ZAPv2):
+    """ZAPv2 client that sends API calls over one persistent keep-alive session.
+    zapv2 opens a new requests.Session (and TCP connection) for every API call; the polling loops
+    call the API many times per scan, so the connection to the ZAP proxy is kept warm instead."""
+
+    def __init__(self, proxies=None, apikey=None, validate_status_code=False):
+        super().__init__(proxies=proxies, apikey=apikey, validate_status_code=validate_status_code)
+        # Use the proxies ZAPv2 resolved, including its 127.0.0.1:8080 default when none are passed
+        self._proxies = self._ZAPv2__proxies
+        self._validate_status_code = validate_status_code
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.headers['Connection'] = 'keep-alive'
+        if apikey is not None:
+            self._session.headers['X-ZAP-API-Key'] = apikey
+
+    def _request_api(self, url, query=None, method="GET", body=None):
+        """Same contract as ZAPv2._request_api, over the shared session."""
+        if not url.startswith('http://zap/'):
+            # Only allow requests to the API so that we never leak the apikey
+            raise ValueError('A non ZAP API url was specified ' + url)
+
+        try:
+            response = self._session.request(method, url, params=query, data=body, proxies=self._proxies, verify=False)
+        except requests.ConnectionError:
+            # A pooled connection may have been dropped by ZAP; drop the pool and retry once on a fresh one.
+            # Only read-only view calls are replayed: an action (e.g. spider.scan) may already have reached ZAP.
+            self._session.close()
+            if method != "GET" or '/view/' not in url:
+                raise
+            response = self._session.request(method, url, params=query, data=body, proxies=self._proxies, verify=False)
+
+        if self._validate_status_code and 300 <= response.status_code < 500:
+            raise Exception("Non-successful status code returned from ZAP, which indicates a bad request: "
+                            + str(response.status_code)
+                            + "response: " + response.text)
+        elif self._validate_status_code and response.status_code >= 500:
+            raise Exception("Non-successful status code returned from ZAP, which indicates a ZAP internal error: "
+                            + str(response.status_code)
+                            + "response: " + response.text)
+        return response
+
+def poll_until_done(get_status, is_done, label: str, start: float = 0.2, max_interval: float = 30.0,
+                    is_near_done=None, near_done_interval: float = 2.0, timeout: float = None) -> bool:
+    """Poll a ZAP status until is_done(status) holds, backing off exponentially between polls.
+    Early polls are frequent so quick scans are picked up without a fixed multi-second wait; long
+    scans settle at one poll every max_interval seconds. While is_near_done(status) holds, waits are
+    capped at near_done_interval so completion is not noticed late (scans can sit near 100% for minutes).
+    Returns False if timeout seconds pass before the status is done; waits never run past the timeout."""
+    deadline = None if timeout is None else time.time() + timeout
+    interval = start
+    while True:
+        status = get_status()
+        if is_done(status):
+            return True
+        if deadline is not None and time.time() >= deadline:
+            return False
+        print(f'{label}: {status}')
+        delay = interval
+        if is_near_done is not None and is_near_done(status):
+            delay = min(delay, near_done_interval)
+        if deadline is not None:
+            delay = min(delay, max(0.0, deadline - time.time()))
+        time.sleep(delay)
+        interval = min(max_interval, interval * 1.5)
+
+def wait_for_scan_start(get_status, attempts: int = 20, interval: float = 0.1):
+    """Wait until ZAP reports a numeric status for a scan that was just started.
+    Used instead of a fixed sleep after starting a scan; gives up after attempts polls."""
+    for _ in range(attempts):
+        try:
+            int(get_status())
+            return
+        except (ValueError, TypeError):
+            time.sleep(interval)
+
+def _risk_badge_html(color, label):
+    return f'<span style="background-color: {color}; color: white; padding: 4px 8px; border-radius: 4px; font-weight: bold; font-size: 0.85em;">{label}</span>'
+
+# Badges for the known risk levels, rendered once; other values fall back to a grey badge
+_RISK_COLORS = {
+    "high": "#dc3545",
+    "medium": "#ffc107",
+    "low": "#28a745",
+    "informational": "#17a2b8"
+}
+_UNKNOWN_RISK_COLOR = "#6c757d"
+_RISK_BADGE = {risk: _risk_badge_html(color, risk.upper()) for risk, color in _RISK_COLORS.items()}
+_UNKNOWN_BADGE = _risk_badge_html(_UNKNOWN_RISK_COLOR, "UNKNOWN")
+
 def format_risk_badge(risk):
     """Format risk level as a colored badge."""
-    risk_lower = risk.lower() if risk else "unknown"
-    colors = {
-        "high": "#dc3545",
-        "medium": "#ffc107",
-        "low": "#28a745",
-        "informational": "#17a2b8"
-    }
-    color = colors.get(risk_lower, "#6c757d")
-    return f'<span style="background-color: {color}; color: white; padding: 4px 8px; border-radius: 4px; font-weight: bold; font-size: 0.85em;">{risk.upper() if risk else "UNKNOWN"}</span>'
+    if not risk:
+        return _UNKNOWN_BADGE
+    badge = _RISK_BADGE.get(risk.lower())
+    if badge is None:
+        badge = _risk_badge_html(_UNKNOWN_RISK_COLOR, risk.upper())
+    return badge
+
+# Markdown patterns used by format_summary_text, compiled once rather than on every summary
+_RE_H3 = re.compile(r'^### (.*)$', re.MULTILINE)
+_RE_H2 = re.compile(r'^## (.*)$', re.MULTILINE)
+_RE_BOLD = re.compile(r'\*\*(.*?)\*\*')
 
 def format_summary_text(text):
     """Convert markdown-like text to HTML with proper escaping."""
     if not text:
         return ""
+    # Plain prose has no markdown markers, so the regex passes can be skipped; check before
+    # escaping, which can itself add '#' (&#x27;)
+    has_markdown = "#" in text or "*" in text
     # Escape HTML first
     text = html.escape(text)
     # Convert markdown headers
-    text = re.sub(r'^### (.*)$', r'<h3>\1</h3>', text, flags=re.MULTILINE)
-    text = re.sub(r'^## (.*)$', r'<h2>\1</h2>', text, flags=re.MULTILINE)
-    text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
+    if has_markdown:
+        text = _RE_H3.sub(r'<h3>\1</h3>', text)
+        text = _RE_H2.sub(r'<h2>\1</h2>', text)
+        text = _RE_BOLD.sub(r'<strong>\1</strong>', text)
     # Convert line breaks
     text = text.replace('\n', '<br>')
     return text
 
-def generate_html_report(new_alerts_with_summaries, resolved_alerts_with_summaries, common_alerts_with_summaries,
-                         new_summaries, resolved_summaries, common_summaries,
-                         new_final_summary, resolved_final_summary, common_final_summary,
-                         new_count, resolved_count, common_count):
-    """Generate a visually appealing HTML security report."""
-    
-    # Use the alert data directly (summaries are already in the alert objects)
-    new_alerts_parsed = new_alerts_with_summaries if new_alerts_with_summaries else []
-    resolved_alerts_parsed = resolved_alerts_with_summaries if resolved_alerts_with_summaries else []
-    common_alerts_parsed = common_alerts_with_summaries if common_alerts_with_summaries else []
-    
-    html_content = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Security Scan Report</title>
-    <style>
-        * {{
+def _alert_json_html(alert):
+    """Pretty-printed, HTML-escaped JSON of an alert for the details block."""
+    return html.escape(json_utils.dumps(alert, indent=True).decode("utf-8"))
+
+def _prerender_alerts(alerts):
+    """Escape and format the per-alert fields of a section in one pass.
+    Returns (name, badge, details JSON, summary) HTML tuples; the alerts themselves are left untouched,
+    since extra keys would show up in the details JSON."""
+    return [
+        (
+            html.escape(str(alert.get('name', 'Unknown Alert'))),
+            format_risk_badge(alert.get('risk', 'Unknown')),
+            _alert_json_html(alert),
+            format_summary_text(alert.get('summary', 'No summary available.')),
+        )
+        for alert in alerts
+    ]
+
+def _section_open(title_html, section_class):
+    return f"""
+        <div class="section {section_class}">
+            <h2>{title_html}</h2>
+"""
+
+_SECTION_CLOSE = """
+        </div>
+"""
+
+def _empty_section(title_html, empty_msg, section_class):
+    return _section_open(title_html, section_class) + f'<div class="empty-state">{empty_msg}</div>' + _SECTION_CLOSE
+
+# Sections of an empty category, with the count of 0 baked in; most PR scans have at least one empty category
+_EMPTY_NEW = _empty_section("🆕 New Alerts (0)", "No new alerts.", "new")
+_EMPTY_RESOLVED = _empty_section("✅ Resolved Alerts (0)", "No resolved alerts.", "resolved")
+_EMPTY_COMMON = _empty_section("⚙️ Existing Alerts (0)", "No existing alerts.", "common")
+
+def _render_alert_section(out, title_html, alerts, empty_msg, section_class):
+    """Write one alert section (header, alert cards or empty state) to the report."""
+    if not alerts:
+        out.write(_empty_section(title_html, empty_msg, section_class))
+        return
+    out.write(_section_open(title_html, section_class))
+    for i, (name, badge, alert_json, summary) in enumerate(_prerender_alerts(alerts), 1):
+        out.write(f"""
+            <div class="alert-card">
+                <div class="alert-header">
+                    <div class="alert-title">Alert {i}: {name}</div>
+                    {badge}
+                </div>
+                <details>
+                    <summary class="collapsible" style="cursor: pointer; color: #667eea; margin: 10px 0;">📋 View Alert Details</summary>
+                    <div class="alert-details"><pre>{alert_json}</pre></div>
+                </details>
+                <div class="alert-summary">
+                    <strong>Summary:</strong><br>
+                    <div style="margin-top: 10px;">{summary}</div>
+                </div>
+            </div>
+""")
+    out.write(_SECTION_CLOSE)
+
+# Stylesheet for the HTML report; static, so it lives outside the f-string template
+_REPORT_CSS = """        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
-        body {{
+        }
+        body {
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
             line-height: 1.6;
             color: #333;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             padding: 20px;
             min-height: 100vh;
-        }}
-        .container {{
+        }
+        .container {
             max-width: 1200px;
             margin: 0 auto;
             background: white;
             border-radius: 12px;
             box-shadow: 0 10px 40px rgba(0,0,0,0.2);
             overflow: hidden;
-        }}
-        .header {{
+        }
+        .header {
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             color: white;
             padding: 30px;
             text-align: center;
-        }}
-        .header h1 {{
+        }
+        .header h1 {
             font-size: 2.5em;
             margin-bottom: 10px;
-        }}
-        .header .timestamp {{
+        }
+        .header .timestamp {
             opacity: 0.9;
             font-size: 0.9em;
-        }}
-        .stats {{
+        }
+        .stats {
             display: flex;
             justify-content: center;
             gap: 20px;
             padding: 30px;
             background: #f8f9fa;
             flex-wrap: wrap;
-        }}
-        .stat-card {{
+        }
+        .stat-card {
             background: white;
             padding: 20px 30px;
             border-radius: 8px;
             box-shadow: 0 2px 8px rgba(0,0,0,0.1);
             text-align: center;
             min-width: 150px;
-        }}
-        .stat-card.new {{
+        }
+        .stat-card.new {
             border-left: 4px solid #dc3545;
-        }}
-        .stat-card.resolved {{
+        }
+        .stat-card.resolved {
             border-left: 4px solid #28a745;
-        }}
-        .stat-card.common {{
+        }
+        .stat-card.common {
             border-left: 4px solid #ffc107;
-        }}
-        .stat-number {{
+        }
+        .stat-number {
             font-size: 2.5em;
             font-weight: bold;
             margin-bottom: 5px;
-        }}
-        .stat-label {{
+        }
+        .stat-label {
             color: #666;
             font-size: 0.9em;
-        }}
-        .section {{
+        }
+        .section {
             margin: 30px;
             padding: 25px;
             background: #f8f9fa;
             border-radius: 8px;
             border-left: 4px solid;
-        }}
-        .section.new {{
+        }
+        .section.new {
             border-left-color: #dc3545;
-        }}
-        .section.resolved {{
+        }
+        .section.resolved {
             border-left-color: #28a745;
-        }}
-        .section.common {{
+        }
+        .section.common {
             border-left-color: #ffc107;
-        }}
-        .section h2 {{
+        }
+        .section h2 {
             margin-bottom: 20px;
             font-size: 1.8em;
             display: flex;
             align-items: center;
             gap: 10px;
-        }}
-        .alert-card {{
+        }
+        .alert-card {
             background: white;
             margin: 15px 0;
             padding: 20px;
             border-radius: 8px;
             box-shadow: 0 2px 4px rgba(0,0,0,0.1);
             border-left: 4px solid #667eea;
-        }}
-        .alert-header {{
+        }
+        .alert-header {
             display: flex;
             justify-content: space-between;
             align-items: center;
             margin-bottom: 15px;
             flex-wrap: wrap;
             gap: 10px;
-        }}
-        .alert-title {{
+        }
+        .alert-title {
             font-size: 1.3em;
             font-weight: bold;
             color: #333;
-        }}
-        .alert-details {{
+        }
+        .alert-details {
             margin: 15px 0;
             padding: 15px;
             background: #f8f9fa;
@@ -208,70 +346,107 @@ def generate_html_report(new_alerts_with_summaries, resolved_alerts_with_summari
             font-family: 'Courier New', monospace;
             font-size: 0.9em;
             overflow-x: auto;
-        }}
-        .alert-details pre {{
+        }
+        .alert-details pre {
             margin: 0;
             white-space: pre-wrap;
             word-wrap: break-word;
-        }}
-        .alert-summary {{
+        }
+        .alert-summary {
             margin-top: 15px;
             padding: 15px;
             background: #e7f3ff;
             border-radius: 6px;
             border-left: 3px solid #667eea;
-        }}
-        .summary-section {{
+        }
+        .summary-section {
             margin: 30px;
             padding: 25px;
             background: white;
             border-radius: 8px;
             box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        }}
-        .summary-section h2 {{
+        }
+        .summary-section h2 {
             margin-bottom: 15px;
             color: #667eea;
-        }}
-        .summary-content {{
+        }
+        .summary-content {
             line-height: 1.8;
             white-space: pre-wrap;
-        }}
-        .empty-state {{
+        }
+        .empty-state {
             text-align: center;
             padding: 40px;
             color: #999;
             font-style: italic;
-        }}
-        .collapsible {{
+        }
+        .collapsible {
             cursor: pointer;
             user-select: none;
-        }}
-        .collapsible:hover {{
+        }
+        .collapsible:hover {
             opacity: 0.8;
-        }}
-        .collapsible-content {{
+        }
+        .collapsible-content {
             max-height: 0;
             overflow: hidden;
             transition: max-height 0.3s ease-out;
-        }}
-        .collapsible-content.expanded {{
+        }
+        .collapsible-content.expanded {
             max-height: 5000px;
-        }}
-        @media (max-width: 768px) {{
-            .stats {{
+        }
+        @media (max-width: 768px) {
+            .stats {
                 flex-direction: column;
-            }}
-            .stat-card {{
+            }
+            .stat-card {
                 width: 100%;
-            }}
-        }}
-    </style>
+            }
+        }
+"""
+
+# Static pieces of the report, built once at import; generate_html_report only fills in the dynamic parts
+_REPORT_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Security Scan Report</title>
+    <style>
+""" + _REPORT_CSS
+
+_FINAL_SUMMARY_OPEN = """
+        <div class="summary-section">
+            <h2>📊 Final Summary</h2>
+"""
+
+_REPORT_CLOSE = """
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+def generate_html_report(out, new_alerts_with_summaries, resolved_alerts_with_summaries, common_alerts_with_summaries,
+                         new_summaries, resolved_summaries, common_summaries,
+                         new_final_summary, resolved_final_summary, common_final_summary,
+                         new_count, resolved_count, common_count):
+    """Generate a visually appealing HTML security report, writing it to the text file out piece by piece."""
+    
+    # Use the alert data directly (summaries are already in the alert objects)
+    new_alerts_parsed = new_alerts_with_summaries if new_alerts_with_summaries else []
+    resolved_alerts_parsed = resolved_alerts_with_summaries if resolved_alerts_with_summaries else []
+    common_alerts_parsed = common_alerts_with_summaries if common_alerts_with_summaries else []
+    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    out.write(_REPORT_HEAD)
+    out.write(f"""    </style>
 </head>
 <body>
     <div class="container">
         <div class="header">
             <h1>🔒 Security Scan Report</h1>
-            <div class="timestamp">Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</div>
+            <div class="timestamp">Generated: {ts}</div>
         </div>
         
         <div class="stats">
@@ -288,161 +463,52 @@ def generate_html_report(new_alerts_with_summaries, resolved_alerts_with_summari
                 <div class="stat-label">⚙️ Existing Alerts</div>
             </div>
         </div>
-"""
+""")
     
-    # New Alerts Section
-    html_content += f"""
-        <div class="section new">
-            <h2>🆕 New Alerts ({new_count})</h2>
-"""
-    if new_alerts_parsed:
-        for i, alert in enumerate(new_alerts_parsed, 1):
-            risk = alert.get('risk', 'Unknown')
-            name = html.escape(str(alert.get('name', 'Unknown Alert')))
-            summary = alert.get('summary', 'No summary available.')
-            alert_json = html.escape(json.dumps(alert, indent=2))
-            
-            html_content += f"""
-            <div class="alert-card">
-                <div class="alert-header">
-                    <div class="alert-title">Alert {i}: {name}</div>
-                    {format_risk_badge(risk)}
-                </div>
-                <details>
-                    <summary class="collapsible" style="cursor: pointer; color: #667eea; margin: 10px 0;">📋 View Alert Details</summary>
-                    <div class="alert-details"><pre>{alert_json}</pre></div>
-                </details>
-                <div class="alert-summary">
-                    <strong>Summary:</strong><br>
-                    <div style="margin-top: 10px;">{format_summary_text(summary)}</div>
-                </div>
-            </div>
-"""
+    # Alert sections
+    if new_count == 0:
+        out.write(_EMPTY_NEW)
     else:
-        html_content += '<div class="empty-state">No new alerts.</div>'
-    
-    html_content += """
-        </div>
-"""
-    
-    # Resolved Alerts Section
-    html_content += f"""
-        <div class="section resolved">
-            <h2>✅ Resolved Alerts ({resolved_count})</h2>
-"""
-    if resolved_alerts_parsed:
-        for i, alert in enumerate(resolved_alerts_parsed, 1):
-            risk = alert.get('risk', 'Unknown')
-            name = html.escape(str(alert.get('name', 'Unknown Alert')))
-            summary = alert.get('summary', 'No summary available.')
-            alert_json = html.escape(json.dumps(alert, indent=2))
-            
-            html_content += f"""
-            <div class="alert-card">
-                <div class="alert-header">
-                    <div class="alert-title">Alert {i}: {name}</div>
-                    {format_risk_badge(risk)}
-                </div>
-                <details>
-                    <summary class="collapsible" style="cursor: pointer; color: #667eea; margin: 10px 0;">📋 View Alert Details</summary>
-                    <div class="alert-details"><pre>{alert_json}</pre></div>
-                </details>
-                <div class="alert-summary">
-                    <strong>Summary:</strong><br>
-                    <div style="margin-top: 10px;">{format_summary_text(summary)}</div>
-                </div>
-            </div>
-"""
+        _render_alert_section(out, f"🆕 New Alerts ({new_count})", new_alerts_parsed, "No new alerts.", "new")
+    if resolved_count == 0:
+        out.write(_EMPTY_RESOLVED)
     else:
-        html_content += '<div class="empty-state">No resolved alerts.</div>'
-    
-    html_content += """
-        </div>
-"""
-    
-    # Common/Older Alerts Section
-    html_content += f"""
-        <div class="section common">
-            <h2>⚙️ Existing Alerts ({common_count})</h2>
-"""
-    if common_alerts_parsed:
-        for i, alert in enumerate(common_alerts_parsed, 1):
-            risk = alert.get('risk', 'Unknown')
-            name = html.escape(str(alert.get('name', 'Unknown Alert')))
-            summary = alert.get('summary', 'No summary available.')
-            alert_json = html.escape(json.dumps(alert, indent=2))
-            
-            html_content += f"""
-            <div class="alert-card">
-                <div class="alert-header">
-                    <div class="alert-title">Alert {i}: {name}</div>
-                    {format_risk_badge(risk)}
-                </div>
-                <details>
-                    <summary class="collapsible" style="cursor: pointer; color: #667eea; margin: 10px 0;">📋 View Alert Details</summary>
-                    <div class="alert-details"><pre>{alert_json}</pre></div>
-                </details>
-                <div class="alert-summary">
-                    <strong>Summary:</strong><br>
-                    <div style="margin-top: 10px;">{format_summary_text(summary)}</div>
-                </div>
-            </div>
-"""
+        _render_alert_section(out, f"✅ Resolved Alerts ({resolved_count})", resolved_alerts_parsed, "No resolved alerts.", "resolved")
+    if common_count == 0:
+        out.write(_EMPTY_COMMON)
     else:
-        html_content += '<div class="empty-state">No existing alerts.</div>'
-    
-    html_content += """
-        </div>
-"""
+        _render_alert_section(out, f"⚙️ Existing Alerts ({common_count})", common_alerts_parsed, "No existing alerts.", "common")
     
     # Final Summary Section
-    html_content += """
-        <div class="summary-section">
-            <h2>📊 Final Summary</h2>
-"""
-    
-    if new_final_summary:
-        html_content += f"""
-            <div style="margin-bottom: 30px;">
-                <h3 style="color: #dc3545; margin-bottom: 10px;">🆕 New Alerts Summary</h3>
-                <div class="summary-content">{format_summary_text(new_final_summary)}</div>
-            </div>
-"""
-    
-    if common_final_summary:
-        html_content += f"""
-            <div style="margin-bottom: 30px;">
-                <h3 style="color: #ffc107; margin-bottom: 10px;">⚙️ Existing Alerts Summary</h3>
-                <div class="summary-content">{format_summary_text(common_final_summary)}</div>
-            </div>
-"""
-    
-    if resolved_final_summary:
-        html_content += f"""
+    out.write(_FINAL_SUMMARY_OPEN)
+    for final_summary, color, title in (
+        (new_final_summary, "#dc3545", "🆕 New Alerts Summary"),
+        (common_final_summary, "#ffc107", "⚙️ Existing Alerts Summary"),
+        (resolved_final_summary, "#28a745", "✅ Resolved Alerts Summary"),
+    ):
+        if final_summary:
+            out.write(f"""
             <div style="margin-bottom: 30px;">
-                <h3 style="color: #28a745; margin-bottom: 10px;">✅ Resolved Alerts Summary</h3>
-                <div class="summary-content">{format_summary_text(resolved_final_summary)}</div>
+                <h3 style="color: {color}; margin-bottom: 10px;">{title}</h3>
+                <div class="summary-content">{format_summary_text(final_summary)}</div>
             </div>
-"""
-    
-    html_content += """
-        </div>
-    </div>
-</body>
-</html>
-"""
+""")
     
-    return html_content
+    out.write(_REPORT_CLOSE)
 
-# Get values
-ZAP_PORT = int(os.getenv("ZAP_PORT", 8090))
-ZAP_API_KEY = os.getenv("ZAP_API_KEY")
-ZAP_HOST = os.getenv("ZAP_HOST", "http://localhost")
-TARGET_URL = os.getenv("TARGET_URL")
-GITHUB_REPO = os.getenv("GITHUB_REPO")  # Format: "owner/repo"
+# Get values; the environment is read once here and referenced through ENV
+ENV = SimpleNamespace(
+    zap_port=int(os.getenv("ZAP_PORT", 8090)),
+    zap_api_key=os.getenv("ZAP_API_KEY"),
+    zap_host=os.getenv("ZAP_HOST", "http://localhost"),
+    target_url=os.getenv("TARGET_URL"),
+    github_repo=os.getenv("GITHUB_REPO"),  # Format: "owner/repo"
+    report_suffix=os.getenv("REPORT_SUFFIX", ""),  # main or pr or empty if not set
+    github_run_id=os.getenv("GITHUB_RUN_ID"),
+)
 
 # Initialize ZAP API client
-zap = ZAPv2(apikey=ZAP_API_KEY, proxies={'http': f"{ZAP_HOST}:{ZAP_PORT}", 'https': f"{ZAP_HOST}:{ZAP_PORT}"})
+zap = KeepAliveZAPv2(apikey=ENV.zap_api_key, proxies={'http': f"{ENV.zap_host}:{ENV.zap_port}", 'https': f"{ENV.zap_host}:{ENV.zap_port}"})
 
 # Clear previous alerts and create a new session for this scan
 print('🔄 Clearing previous ZAP session and alerts...')
@@ -460,34 +526,29 @@ except Exception as e:
         print(f'⚠️ Warning: Could not clear alerts: {e2}')
 
 # Access the target URL first
-print(f'Accessing target {TARGET_URL}')
-zap.urlopen(TARGET_URL)
-time.sleep(2)
+print(f'Accessing target {ENV.target_url}')
+zap.urlopen(ENV.target_url)
 
 # 🕷️ Spider Scan
 if run_spider:
-    print(f'🕷️ Spidering target {TARGET_URL}')
-    scanid = zap.spider.scan(TARGET_URL)
-    time.sleep(2)
-    while int(zap.spider.status(scanid)) < 100:
-        print(f'Spider progress %: {zap.spider.status(scanid)}')
-        time.sleep(2)
+    print(f'🕷️ Spidering target {ENV.target_url}')
+    scanid = zap.spider.scan(ENV.target_url)
+    wait_for_scan_start(lambda: zap.spider.status(scanid))
+    poll_until_done(lambda: int(zap.spider.status(scanid)), lambda progress: progress >= 100, 'Spider progress %',
+                    is_near_done=lambda progress: progress > 95)
     print('🕷️ Spider completed')
 else:
     print('🚫 Skipping Spider scan as per config.')
 
 # ⚡ AJAX Spider
 if run_ajax_spider:
-    print(f'⚡ AJAX Spidering target {TARGET_URL}')
-    zap.ajaxSpider.scan(TARGET_URL)
+    print(f'⚡ AJAX Spidering target {ENV.target_url}')
+    zap.ajaxSpider.scan(ENV.target_url)
 
-    timeout = time.time() + ajax_spider_timeout
-    while zap.ajaxSpider.status == 'running':
-        if time.time() > timeout:
-            print('⚠️ AJAX Spider timed out!')
-            break
-        print(f'AJAX Spider status: {zap.ajaxSpider.status}')
-        time.sleep(2)
+    # No progress percentage to tighten polling near the end, so keep the backoff short
+    if not poll_until_done(lambda: zap.ajaxSpider.status, lambda status: status != 'running', 'AJAX Spider status',
+                           max_interval=5.0, timeout=ajax_spider_timeout):
+        print('⚠️ AJAX Spider timed out!')
 
     print('⚡ AJAX Spider completed')
     ajax_results = zap.ajaxSpider.results(start=0, count=10)
@@ -497,153 +558,134 @@ else:
 
 # 🧠 Passive Scan
 if run_passive:
-    while int(zap.pscan.records_to_scan) > 0:
-        print(f'Passive scan records left: {zap.pscan.records_to_scan}')
-        time.sleep(2)
+    # No progress percentage to tighten polling near the end, so keep the backoff short
+    poll_until_done(lambda: int(zap.pscan.records_to_scan), lambda records: records <= 0, 'Passive scan records left',
+                    max_interval=5.0)
     print('🧠 Passive scan completed')
 else:
     print('🚫 Skipping Passive scan as per config.')
 
 # 💥 Active Scan
 if run_active:
-    print(f'💥 Active scanning target {TARGET_URL}')
-    scanid = zap.ascan.scan(TARGET_URL)
-    time.sleep(5)
-    while int(zap.ascan.status(scanid)) < 100:
-        print(f'Active scan progress %: {zap.ascan.status(scanid)}')
-        time.sleep(5)
+    print(f'💥 Active scanning target {ENV.target_url}')
+    scanid = zap.ascan.scan(ENV.target_url)
+    wait_for_scan_start(lambda: zap.ascan.status(scanid))
+    poll_until_done(lambda: int(zap.ascan.status(scanid)), lambda progress: progress >= 100, 'Active scan progress %',
+                    is_near_done=lambda progress: progress > 95)
     print('💥 Active scan completed')
 else:
     print('🚫 Skipping Active scan as per config.')
 
 # ✅ Sort and save alerts in JSON file
-suffix = os.getenv("REPORT_SUFFIX", "")   # main or pr or empty if not set
-json_report_filename = f"security_report_{suffix}.json"
+json_report_filename = f"security_report_{ENV.report_suffix}.json"
 alerts = sort_and_save_alerts(zap.core.alerts(), json_report_filename)
 print(f"📄 JSON report saved as: {json_report_filename}")
 
 # ✅ Process and summarize alerts
 # Note : PR scan should be done after the main scan is done
-if suffix == "pr":
-    alert_diff("security_report_main.json", "security_report_pr.json")
+if ENV.report_suffix == "pr":
+    # Diff against the saved main report, using the PR alerts already in memory
+    new_alerts_data, resolved_alerts_data, common_alerts_data = alert_diff(
+        "security_report_main.json", "security_report_pr.json", pr_alerts=alerts)
     
-    # Process each alerts file to get summaries
-    new_alerts_data = load_alerts("new_alerts.json")
-    resolved_alerts_data = load_alerts("resolved_alerts.json")
-    common_alerts_data = load_alerts("common_alerts.json")
+    # Get summaries for each category; the categories are independent LLM workloads, so run them concurrently
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        new_future = executor.submit(
+            get_alert_summaries_and_final_summary,
+            new_alerts_data, 
+            prompt_path=".security/prompts/prompt_alert.txt", 
+            prompt_final_path=".security/prompts/prompt_final.txt", 
+            include_pr_changes=True)
+
+        resolved_future = executor.submit(
+            get_alert_summaries_and_final_summary,
+            resolved_alerts_data, 
+            prompt_path=".security/prompts/prompt_solved_alert.txt", 
+            prompt_final_path=".security/prompts/prompt_solved_final.txt")
+
+        common_future = executor.submit(
+            get_alert_summaries_and_final_summary,
+            common_alerts_data, 
+            prompt_path=".security/prompts/prompt_alert.txt", 
+            prompt_final_path=".security/prompts/prompt_final.txt", 
+            include_pr_changes=False)
+
+    new_summaries, new_final_summary, new_fail_count, new_alerts_with_summaries = new_future.result()
+    resolved_summaries, resolved_final_summary, resolved_fail_count, resolved_alerts_with_summaries = resolved_future.result()
+    common_summaries, common_final_summary, common_fail_count, common_alerts_with_summaries = common_future.result()
     
-    # Get summaries for each category
-    new_summaries, new_final_summary, new_fail_count, new_alerts_with_summaries = get_alert_summaries_and_final_summary(
-        new_alerts_data, 
-        prompt_path=".security/prompts/prompt_alert.txt", 
-        prompt_final_path=".security/prompts/prompt_final.txt", 
-        include_pr_changes=True)
-
-    resolved_summaries, resolved_final_summary, resolved_fail_count, resolved_alerts_with_summaries = get_alert_summaries_and_final_summary(
-        resolved_alerts_data, 
-        prompt_path=".security/prompts/prompt_solved_alert.txt", 
-        prompt_final_path=".security/prompts/prompt_solved_final.txt")
-
-    common_summaries, common_final_summary, common_fail_count, common_alerts_with_summaries = get_alert_summaries_and_final_summary(
-        common_alerts_data, 
-        prompt_path=".security/prompts/prompt_alert.txt", 
-        prompt_final_path=".security/prompts/prompt_final.txt", 
-        include_pr_changes=False)
+    # The diff artifacts were written while the summaries ran; report them before anything can exit
+    wait_for_artifacts()
     
     # Check for pipeline-failing alerts
     total_fail_count = new_fail_count + common_fail_count
     if total_fail_count > 0:
-        fail_levels = config.get('fail_on_levels', [])
+        fail_levels = CONFIG.get('fail_on_levels', [])
         fail_levels_str = ', '.join(fail_levels) if fail_levels else 'configured risk levels'
         print(f"❌ Found {total_fail_count} alert(s) at level(s) [{fail_levels_str}] configured to fail the pipeline.")
         sys.exit(1)
     
     # Build structured report
-    resolved_alerts_count = count_alerts("resolved_alerts.json")
-    new_alerts_count = count_alerts("new_alerts.json")
-    
-    # Generate HTML report
-    html_content = generate_html_report(
-        new_alerts_with_summaries if new_alerts_count > 0 else [],
-        resolved_alerts_with_summaries if resolved_alerts_count > 0 else [],
-        common_alerts_with_summaries if len(common_alerts_data) > 0 else [],
-        new_summaries,
-        resolved_summaries,
-        common_summaries,
-        new_final_summary,
-        resolved_final_summary,
-        common_final_summary,
-        new_alerts_count,
-        resolved_alerts_count,
-        len(common_alerts_data)
-    )
+    resolved_alerts_count = len(resolved_alerts_data)
+    new_alerts_count = len(new_alerts_data)
+    common_alerts_count = len(common_alerts_data)
     
-    # Write the HTML report
+    # Generate the HTML report straight into the file
     with open("security_report.html", "w", encoding="utf-8") as f:
-        f.write(html_content)
+        generate_html_report(
+            f,
+            new_alerts_with_summaries if new_alerts_count > 0 else [],
+            resolved_alerts_with_summaries if resolved_alerts_count > 0 else [],
+            common_alerts_with_summaries if common_alerts_count > 0 else [],
+            new_summaries,
+            resolved_summaries,
+            common_summaries,
+            new_final_summary,
+            resolved_final_summary,
+            common_final_summary,
+            new_alerts_count,
+            resolved_alerts_count,
+            common_alerts_count
+        )
     
     print(f"📄 Security report saved as: security_report.html")
 
     # ✅ Post interactive summary as PR comment with collapsible sections
-    artifact_link = f"https://github.com/{GITHUB_REPO}/actions/runs/{os.getenv('GITHUB_RUN_ID')}"
+    artifact_link = f"https://github.com/{ENV.github_repo}/actions/runs/{ENV.github_run_id}"
     
     # Build interactive comment with collapsible sections
-    comment_body = "### 🔒 Security Scan Summary 🚨\n\n"
+    comment_parts = ["### 🔒 Security Scan Summary 🚨\n\n"]
     
     # Add quick stats at the top
-    total_new = new_alerts_count
-    total_resolved = resolved_alerts_count
-    total_common = len(common_alerts_data)
-    
-    comment_body += f"**Quick Stats:** "
     stats_parts = []
-    if total_new > 0:
-        stats_parts.append(f"🆕 {total_new} new")
-    if total_resolved > 0:
-        stats_parts.append(f"✅ {total_resolved} resolved")
-    if total_common > 0:
-        stats_parts.append(f"⚙️ {total_common} existing")
-    comment_body += " | ".join(stats_parts) if stats_parts else "No alerts"
-    comment_body += "\n\n---\n\n"
+    if new_alerts_count > 0:
+        stats_parts.append(f"🆕 {new_alerts_count} new")
+    if resolved_alerts_count > 0:
+        stats_parts.append(f"✅ {resolved_alerts_count} resolved")
+    if common_alerts_count > 0:
+        stats_parts.append(f"⚙️ {common_alerts_count} existing")
+    comment_parts.append(f"**Quick Stats:** {' | '.join(stats_parts) if stats_parts else 'No alerts'}\n\n---\n\n")
     
     # If no alerts at all, show a success message
     if not stats_parts:
-        comment_body += "✅ **No security alerts found!** Great job keeping the codebase secure.\n\n"
-    
-    # New Alerts Section (collapsible)
-    if new_alerts_count > 0:
-        comment_body += "<details>\n<summary><b>🆕 New Alerts Summary</b> (" + str(new_alerts_count) + " alert" + ("s" if new_alerts_count > 1 else "") + ")</summary>\n\n"
-        if new_final_summary:
-            comment_body += "```\n" + new_final_summary + "\n```\n\n"
-        if new_summaries:
-            comment_body += "<details>\n<summary><b>📋 Detailed New Alerts</b></summary>\n\n"
-            comment_body += "```\n" + new_summaries + "\n```\n\n"
-            comment_body += "</details>\n\n"
-        comment_body += "</details>\n\n"
-    
-    # Resolved Alerts Section (collapsible)
-    if resolved_alerts_count > 0:
-        comment_body += "<details>\n<summary><b>✅ Resolved Alerts Summary</b> (" + str(resolved_alerts_count) + " alert" + ("s" if resolved_alerts_count > 1 else "") + ")</summary>\n\n"
-        if resolved_final_summary:
-            comment_body += "```\n" + resolved_final_summary + "\n```\n\n"
-        if resolved_summaries:
-            comment_body += "<details>\n<summary><b>📋 Detailed Resolved Alerts</b></summary>\n\n"
-            comment_body += "```\n" + resolved_summaries + "\n```\n\n"
-            comment_body += "</details>\n\n"
-        comment_body += "</details>\n\n"
+        comment_parts.append("✅ **No security alerts found!** Great job keeping the codebase secure.\n\n")
     
-    # Older/Common Alerts Section (collapsible)
-    if len(common_alerts_data) > 0:
-        comment_body += "<details>\n<summary><b>⚙️ Existing Alerts Summary</b> (" + str(len(common_alerts_data)) + " alert" + ("s" if len(common_alerts_data) > 1 else "") + ")</summary>\n\n"
-        if common_final_summary:
-            comment_body += "```\n" + common_final_summary + "\n```\n\n"
-        if common_summaries:
-            comment_body += "<details>\n<summary><b>📋 Detailed Existing Alerts</b></summary>\n\n"
-            comment_body += "```\n" + common_summaries + "\n```\n\n"
-            comment_body += "</details>\n\n"
-        comment_body += "</details>\n\n"
+    # New, resolved and older/common alerts sections (collapsible)
+    for count, title, detailed_title, final_summary, summaries in (
+        (new_alerts_count, "🆕 New Alerts Summary", "📋 Detailed New Alerts", new_final_summary, new_summaries),
+        (resolved_alerts_count, "✅ Resolved Alerts Summary", "📋 Detailed Resolved Alerts", resolved_final_summary, resolved_summaries),
+        (common_alerts_count, "⚙️ Existing Alerts Summary", "📋 Detailed Existing Alerts", common_final_summary, common_summaries),
+    ):
+        if count == 0:
+            continue
+        comment_parts.append(f"<details>\n<summary><b>{title}</b> ({count} alert{'s' if count > 1 else ''})</summary>\n\n")
+        if final_summary:
+            comment_parts.append(f"```\n{final_summary}\n```\n\n")
+        if summaries:
+            comment_parts.append(f"<details>\n<summary><b>{detailed_title}</b></summary>\n\n```\n{summaries}\n```\n\n</details>\n\n")
+        comment_parts.append("</details>\n\n")
     
     # Add download link at the bottom
-    comment_body += f"---\n\n📂 **[Download Full Report]({artifact_link})**"
+    comment_parts.append(f"---\n\n📂 **[Download Full Report]({artifact_link})**")
     
-    post_pr_comment(comment_body)
\ No newline at end of file
+    post_pr_comment("".join(comment_parts))
\ No newline at end of file